@@ -6,13 +6,11 @@ from pyannote.audio import Pipeline
 
 audio_file_path = sys.argv[1] if len(sys.argv) > 1 else "system.wav"
 
-# Load audio manually using soundfile
-waveform, sample_rate = sf.read(audio_file_path)
-# Convert to torch tensor and ensure shape is (channels, samples)
-waveform = torch.from_numpy(waveform.T).float()
-# If mono, add channel dimension
-if waveform.dim() == 1:
-    waveform = waveform.unsqueeze(0)
+# Load audio manually using soundfile, straight to float32 and always
+# (samples, channels) so mono files need no special casing
+waveform, sample_rate = sf.read(audio_file_path, dtype="float32", always_2d=True)
+# Convert to torch tensor with shape (channels, samples)
+waveform = torch.from_numpy(waveform.T).contiguous()
 
 # Create audio dict that pyannote expects
 audio_file = {"waveform": waveform, "sample_rate": sample_rate}
@@ -1,104 +1,298 @@
+import argparse
+import os
 import sys
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext, suppress
+from functools import cache
+from heapq import merge
 from os import environ
 from pathlib import Path
 
-import pandas as pd
-import torch
-import whisperx
+import numpy as np
 from dotenv import load_dotenv
-from pyannote.audio import Pipeline
 
-_original_torch_load = torch.load
-torch.load = lambda *args, **kwargs: _original_torch_load(
-    *args, **{**kwargs, "weights_only": False}
-)
+# torch, whisperx, pyannote and pandas are imported where they are first
+# used so --help and bad paths don't pay seconds of import time
 
 load_dotenv()
 
 HF_TOKEN = environ.get("hf_token", "")
-DEVICE = "cpu"
 WHISPER_MODEL = "large-v3"
+# Default number of VAD chunks decoded per forward pass
 BATCH_SIZE = 16
 LANGUAGE = "en"
+# whisperx.load_audio always resamples to this rate
+SAMPLE_RATE = 16000
 
 
-def transcribe_and_align(model, audio_path):
-    audio = whisperx.load_audio(audio_path)
-    result = model.transcribe(audio, batch_size=BATCH_SIZE, language=LANGUAGE)
+@cache
+def patch_torch_load():
+    import torch
 
-    align_model, metadata = whisperx.load_align_model(
-        language_code=LANGUAGE, device=DEVICE
-    )
-    result = whisperx.align(
-        result["segments"],
-        align_model,
-        metadata,
-        audio,
-        DEVICE,
-        return_char_alignments=False,
+    original_torch_load = torch.load
+    torch.load = lambda *args, **kwargs: original_torch_load(
+        *args, **{**kwargs, "weights_only": False}
     )
-    return result, audio
 
 
-def format_timestamp(seconds):
-    m, s = divmod(int(seconds), 60)
-    h, m = divmod(m, 60)
-    return f"{h:02d}:{m:02d}:{s:02d}"
+@cache
+def get_device():
+    import torch
 
+    return "cuda" if torch.cuda.is_available() else "cpu"
 
-def main():
-    self_path = sys.argv[1] if len(sys.argv) > 1 else "recordings/self.wav"
-    others_path = sys.argv[2] if len(sys.argv) > 2 else "recordings/others.wav"
 
-    if not Path(self_path).exists():
-        print(f"Error: {self_path} not found", file=sys.stderr)
-        sys.exit(1)
-    if not Path(others_path).exists():
-        print(f"Error: {others_path} not found", file=sys.stderr)
+def cuda_stream():
+    # Give each GPU workload its own stream so alignment and diarization can
+    # overlap on a single device; a no-op on CPU
+    if get_device() == "cuda":
+        import torch
+
+        return torch.cuda.stream(torch.cuda.Stream())
+    return nullcontext()
+
+
+@cache
+def load_diarize_pipeline():
+    import torch
+    from pyannote.audio import Pipeline
+
+    patch_torch_load()
+    pipeline = Pipeline.from_pretrained(
+        "pyannote/speaker-diarization-3.1", use_auth_token=HF_TOKEN
+    )
+    if pipeline is None:
+        # pyannote has already logged why (missing hf_token or license)
+        print("Error: could not load the diarization pipeline", file=sys.stderr)
         sys.exit(1)
+    return pipeline.to(torch.device(get_device()))
+
+
+def load_whisper_model(device, compute_type, num_workers):
+    import whisperx
+    from whisperx.asr import WhisperModel
 
-    print("Loading WhisperX model...", file=sys.stderr)
-    model = whisperx.load_model(
-        WHISPER_MODEL, DEVICE, language=LANGUAGE, compute_type="int8"
+    # load_model leaves faster-whisper at one CTranslate2 worker, which would
+    # queue concurrent transcribe calls; threads match load_model's default
+    whisper_model = WhisperModel(
+        WHISPER_MODEL,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=4,
+        num_workers=num_workers,
+    )
+    return whisperx.load_model(
+        WHISPER_MODEL,
+        device,
+        language=LANGUAGE,
+        compute_type=compute_type,
+        model=whisper_model,
     )
 
-    # Transcribe self (single speaker, no diarization needed)
-    print("Transcribing self...", file=sys.stderr)
-    self_result, _ = transcribe_and_align(model, self_path)
 
-    for seg in self_result["segments"]:
-        seg["speaker"] = "Me"
+def load_audio_cached(audio_path):
+    # Decoding through ffmpeg dominates reruns on the same recording, so keep
+    # the 16 kHz float32 samples next to it, stamped with the source's size
+    # and mtime, and reuse them while the stamp still matches
+    source = Path(audio_path)
+    sidecar = source.with_name(f"{source.name}.16k.npz")
+    stat = source.stat()
+    stamp = np.array([stat.st_size, stat.st_mtime_ns])
 
-    # Transcribe others (needs diarization)
-    print("Transcribing others...", file=sys.stderr)
-    others_result, others_audio = transcribe_and_align(model, others_path)
+    # A missing, truncated or foreign sidecar just means decoding again
+    with (
+        suppress(OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile),
+        np.load(sidecar) as cached,
+    ):
+        if np.array_equal(cached["stamp"], stamp):
+            return cached["audio"]
 
-    print("Diarizing others...", file=sys.stderr)
-    diarize_pipeline = Pipeline.from_pretrained(
-        "pyannote/speaker-diarization-3.1", use_auth_token=HF_TOKEN
+    import whisperx
+
+    audio = whisperx.load_audio(audio_path)
+
+    # Write atomically so an interrupted run never leaves a half-written
+    # sidecar; if the directory isn't writable, run uncached
+    with suppress(OSError):
+        fd, tmp = tempfile.mkstemp(
+            dir=sidecar.parent, prefix=f"{sidecar.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, audio=audio, stamp=stamp)
+            Path(tmp).replace(sidecar)
+        finally:
+            Path(tmp).unlink(missing_ok=True)
+    return audio
+
+
+def transcribe_and_align(model, align_model, align_metadata, audio_path, batch_size):
+    import whisperx
+
+    # Fix dtype and layout once so every later torch.from_numpy is a view
+    audio = np.ascontiguousarray(load_audio_cached(audio_path), dtype=np.float32)
+    with cuda_stream():
+        result = model.transcribe(audio, batch_size=batch_size, language=LANGUAGE)
+
+        result = whisperx.align(
+            result["segments"],
+            align_model,
+            align_metadata,
+            audio,
+            get_device(),
+            return_char_alignments=False,
+        )
+    return result, audio
+
+
+def diarize_others(others_result, others_audio, others_path):
+    import pandas as pd
+    import torch
+    import whisperx
+
+    diarize_pipeline = load_diarize_pipeline()
+    # load_audio already gives 16 kHz float32 mono, so this is a zero-copy
+    # (1, samples) view pyannote can use without resampling
+    others_waveform = torch.from_numpy(others_audio).unsqueeze(0)
+    with cuda_stream():
+        diarize_result = diarize_pipeline(
+            {
+                "waveform": others_waveform,
+                "sample_rate": SAMPLE_RATE,
+                "uri": Path(others_path).stem,
+            }
+        )
+    if get_device() == "cuda":
+        torch.cuda.synchronize()
+
+    diarize_df = pd.DataFrame(
+        [
+            (segment.start, segment.end, label, speaker)
+            for segment, label, speaker in diarize_result.itertracks(yield_label=True)
+        ],
+        columns=["start", "end", "label", "speaker"],
     )
-    diarize_result = diarize_pipeline(
-        {"waveform": torch.from_numpy(others_audio).unsqueeze(0), "sample_rate": 16000}
+    return whisperx.assign_word_speakers(diarize_df, others_result)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Transcribe a meeting from separate self and others tracks"
     )
-    diarize_df = pd.DataFrame(
-        diarize_result.itertracks(yield_label=True),
-        columns=["segment", "label", "speaker"],
+    parser.add_argument("self_path", nargs="?", default="recordings/self.wav")
+    parser.add_argument("others_path", nargs="?", default="recordings/others.wav")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="VAD chunks per forward pass; lower on small GPUs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-diarize",
+        action="store_true",
+        help="skip speaker diarization and label the others track as 'Other'",
+    )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="transcribe both tracks concurrently and load pyannote in the "
+        "background; faster, but keeps more models in memory at once",
     )
-    diarize_df["start"] = diarize_df["segment"].apply(lambda x: x.start)
-    diarize_df["end"] = diarize_df["segment"].apply(lambda x: x.end)
-    others_result = whisperx.assign_word_speakers(diarize_df, others_result)
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
 
-    # Merge both transcripts by timestamp
-    all_segments = self_result["segments"] + others_result["segments"]
-    all_segments.sort(key=lambda s: s["start"])
+    for path in (args.self_path, args.others_path):
+        if not Path(path).exists():
+            print(f"Error: {path} not found", file=sys.stderr)
+            sys.exit(1)
+    return args
+
+
+def main():
+    args = parse_args()
+    self_path = args.self_path
+    others_path = args.others_path
+
+    import whisperx
+
+    patch_torch_load()
+    device = get_device()
+    compute_type = "float16" if device == "cuda" else "int8"
+
+    # Stages run one after another by default to stay within memory. With a
+    # single worker the pool just runs the tracks in submission order. With
+    # --parallel, one worker fetches the diarization pipeline while the
+    # WhisperX models load here and the other two transcribe the tracks.
+    with ThreadPoolExecutor(max_workers=3 if args.parallel else 1) as pool:
+        diarize_future = None
+        if args.parallel and not args.no_diarize:
+            diarize_future = pool.submit(load_diarize_pipeline)
+
+        print("Loading WhisperX model...", file=sys.stderr)
+        print(f"Using {device} ({compute_type})", file=sys.stderr)
+        model = load_whisper_model(
+            device, compute_type, num_workers=2 if args.parallel else 1
+        )
+        align_model, align_metadata = whisperx.load_align_model(
+            language_code=LANGUAGE, device=device
+        )
+        if diarize_future is not None:
+            # Fail on a bad hf_token now, not after both tracks are transcribed
+            diarize_future.result()
+
+        # Only others needs diarization
+        print("Transcribing self and others...", file=sys.stderr)
+        self_future = pool.submit(
+            transcribe_and_align,
+            model,
+            align_model,
+            align_metadata,
+            self_path,
+            args.batch_size,
+        )
+        others_future = pool.submit(
+            transcribe_and_align,
+            model,
+            align_model,
+            align_metadata,
+            others_path,
+            args.batch_size,
+        )
+
+        # Diarize others as soon as its audio is ready, while self may still
+        # be aligning
+        others_result, others_audio = others_future.result()
+        if args.no_diarize:
+            for seg in others_result["segments"]:
+                seg["speaker"] = "Other"
+        else:
+            print("Diarizing others...", file=sys.stderr)
+            others_result = diarize_others(others_result, others_audio, others_path)
+
+        self_result, _ = self_future.result()
+
+    for seg in self_result["segments"]:
+        seg["speaker"] = "Me"
+
+    # Merge both transcripts by timestamp (each is already in time order)
+    all_segments = merge(
+        self_result["segments"], others_result["segments"], key=lambda s: s["start"]
+    )
 
-    # Output
+    # Output, written in one go rather than a print per segment
+    lines = []
     for seg in all_segments:
-        ts = format_timestamp(seg["start"])
-        speaker = seg.get("speaker", "Unknown")
         text = seg.get("text", "").strip()
         if text:
-            print(f"[{ts}] {speaker}: {text}")
+            start = int(seg["start"])
+            ts = f"{start // 3600:02d}:{start // 60 % 60:02d}:{start % 60:02d}"
+            speaker = seg.get("speaker", "Unknown")
+            lines.append(f"[{ts}] {speaker}: {text}")
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
 if __name__ == "__main__":
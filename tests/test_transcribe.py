@@ -0,0 +1,106 @@
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from diarize import transcribe
+
+
+@pytest.fixture
+def decoder(monkeypatch):
+    # Stand in for whisperx so load_audio_cached's ffmpeg path is observable
+    calls = []
+
+    def load_audio(path):
+        calls.append(path)
+        return np.full(4, len(calls), dtype=np.float32)
+
+    monkeypatch.setitem(
+        sys.modules, "whisperx", types.SimpleNamespace(load_audio=load_audio)
+    )
+    return calls
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = tmp_path / "mtg.wav"
+    path.write_bytes(b"RIFF wav")
+    return path
+
+
+def sidecar_of(path):
+    return path.with_name(path.name + ".16k.npz")
+
+
+def test_miss_decodes_and_writes_sidecar(decoder, recording):
+    audio = transcribe.load_audio_cached(recording)
+
+    assert decoder == [recording]
+    np.testing.assert_array_equal(audio, np.full(4, 1, dtype=np.float32))
+    assert sidecar_of(recording).exists()
+    assert list(recording.parent.glob("*.tmp")) == []
+
+
+def test_hit_skips_decoding(decoder, recording):
+    transcribe.load_audio_cached(recording)
+    audio = transcribe.load_audio_cached(recording)
+
+    assert decoder == [recording]
+    np.testing.assert_array_equal(audio, np.full(4, 1, dtype=np.float32))
+    assert audio.flags.writeable
+
+
+def test_stale_when_size_or_mtime_changes(decoder, recording):
+    transcribe.load_audio_cached(recording)
+
+    # Replaced by a different file with an older mtime, as cp -p would do
+    old = recording.stat().st_mtime_ns - 10**9
+    recording.write_bytes(b"RIFF longer wav")
+    os.utime(recording, ns=(old, old))
+    transcribe.load_audio_cached(recording)
+
+    # Same size, different mtime
+    new = old + 5 * 10**9
+    os.utime(recording, ns=(new, new))
+    audio = transcribe.load_audio_cached(recording)
+
+    assert len(decoder) == 3
+    np.testing.assert_array_equal(audio, np.full(4, 3, dtype=np.float32))
+
+
+def test_corrupt_sidecar_is_decoded_again(decoder, recording):
+    transcribe.load_audio_cached(recording)
+    sidecar = sidecar_of(recording)
+    sidecar.write_bytes(sidecar.read_bytes()[:20])
+
+    audio = transcribe.load_audio_cached(recording)
+
+    assert len(decoder) == 2
+    np.testing.assert_array_equal(audio, np.full(4, 2, dtype=np.float32))
+    transcribe.load_audio_cached(recording)
+    assert len(decoder) == 2
+
+
+def test_extension_is_part_of_the_key(decoder, recording):
+    video = recording.with_suffix(".mp4")
+    video.write_bytes(b"RIFF wav")
+
+    transcribe.load_audio_cached(recording)
+    audio = transcribe.load_audio_cached(video)
+
+    assert decoder == [recording, video]
+    np.testing.assert_array_equal(audio, np.full(4, 2, dtype=np.float32))
+
+
+def test_unwritable_directory_runs_uncached(decoder, recording, monkeypatch):
+    def mkstemp(**_):
+        raise PermissionError(13, "Permission denied")
+
+    monkeypatch.setattr(transcribe.tempfile, "mkstemp", mkstemp)
+    audio = transcribe.load_audio_cached(recording)
+
+    assert decoder == [recording]
+    np.testing.assert_array_equal(audio, np.full(4, 1, dtype=np.float32))
+    assert not sidecar_of(recording).exists()